@@ -1,9 +1,10 @@
 from dataclasses import dataclass 
 import inspect
 import math
-import torch 
-import torch.nn as nn 
-from torch.nn import functional as F 
+import torch
+import torch.nn as nn
+from torch.nn import functional as F
+from torch.nn.attention import SDPBackend, sdpa_kernel
 from hellaswag import render_example, iterate_examples
 
 # -------------------------------------------------------------------
@@ -21,27 +22,31 @@ class CausalSelfAttention(nn.Module):
 
         self.n_head = config.n_head
         self.n_embed = config.n_embed
-        # mask, following OpenAI/HF naming convention as "bias"
-        self.register_buffer("bias", torch.tril(torch.ones(config.block_size, config.block_size))
-                             .view(1, 1, config.block_size, config.block_size))
-        
+        # NOTE: no causal-mask ("bias") buffer here, SDPA builds the mask internally from
+        # is_causal=True; registering it would waste block_size^2 floats per layer and
+        # bloat every checkpoint
+
     def forward(self, x):
         B, T, C = x.size()
 
-        qkv = self.c_attn(x)
-        q, k, v = qkv.split(self.n_embed, dim=2)
-        q = q.view(B, T, self.n_head, C // self.n_head).transpose(1, 2) # (B, nh, T, hs)
-        k = k.view(B, T, self.n_head, C // self.n_head).transpose(1, 2) # (B, nh, T, hs)
-        v = v.view(B, T, self.n_head, C // self.n_head).transpose(1, 2) # (B, nh, T, hs)
+        # carve q, k, v out of the fused projection with a single view + permute instead of
+        # split + per-tensor view/transpose; the three share storage and keep SDPA-friendly
+        # strides without intermediate copies
+        qkv = self.c_attn(x).view(B, T, 3, self.n_head, C // self.n_head)
+        q, k, v = qkv.permute(2, 0, 3, 1, 4).unbind(0) # each (B, nh, T, hs)
 
         # att = (q @ k.transpose(-2, -1)) * (1.0 / math.sqrt(k.size(-1))) 
         # att = att.masked_fill(self.bias[:,:,:T,:T] == 0, float('-inf'))
         # att = F.softmax(att, dim=-1)
         # y = att @ v # (B, nh, T, T) x (B, nh, T, hs) -> (B, nh, T, hs)
-        # NOTE: use FlashAttention
-        y = F.scaled_dot_product_attention(q, k, v, is_causal=True)
-
-        y = y.transpose(1, 2).contiguous().view(B, T, C)
+        # NOTE: use FlashAttention, forced explicitly so SDPA cannot silently fall back
+        # to the slower math/mem-efficient backends (raises instead if flash is unavailable)
+        with sdpa_kernel(SDPBackend.FLASH_ATTENTION):
+            y = F.scaled_dot_product_attention(q, k, v, is_causal=True)
+
+        # reshape instead of contiguous().view so the copy is elided whenever the SDPA
+        # output layout already permits a view
+        y = y.transpose(1, 2).reshape(B, T, C)
         y = self.c_proj(y)
         return y 
 
@@ -100,8 +105,12 @@ class GPT(nn.Module):
         ))
         self.lm_head = nn.Linear(config.n_embed, config.vocab_size, bias=False)
 
-        # weight sharing scheme 
-        self.transformer.wte.weight = self.lm_head.weight 
+        # position ids, cached once so forward avoids a fresh arange allocation every step
+        # (keeps the traced graph shape-static for torch.compile); not persisted in checkpoints
+        self.register_buffer("pos_ids", torch.arange(config.block_size, dtype=torch.long), persistent=False)
+
+        # weight sharing scheme
+        self.transformer.wte.weight = self.lm_head.weight
         
         # init params 
         self.apply(self._init_weights)
@@ -123,7 +132,7 @@ class GPT(nn.Module):
         B, T = idx.size()
         assert T <= self.config.block_size, f"Cannot foward sequence of length {T}, block size is {self.config.block_size}"
 
-        pos = torch.arange(0, T, dtype=torch.long, device=idx.device)   # (T,)
+        pos = self.pos_ids[:T]  # (T,)
         pos_emb = self.transformer.wpe(pos) # (T, n_embed)
         tok_emb = self.transformer.wte(idx) # (B, T, n_embed)
         x = tok_emb + pos_emb
@@ -135,7 +144,10 @@ class GPT(nn.Module):
 
         loss = None
         if targets is not None:
-            loss = F.cross_entropy(logits.view(-1, logits.size(-1)), targets.view(-1))    
+            # the vocab is padded to 50304 for matmul alignment, but tokens >= 50257 never
+            # occur as targets; slice the padding columns out of the loss so the softmax
+            # skips them and they receive no gradient through the tied embedding
+            loss = F.cross_entropy(logits.view(-1, logits.size(-1))[:, :50257], targets.view(-1))
         return logits, loss
     
     @classmethod
@@ -157,8 +169,7 @@ class GPT(nn.Module):
         config = GPTConfig(**config_args)
         model = GPT(config)
         sd = model.state_dict()
-        sd_keys = sd.keys()
-        sd_keys = [k for k in sd_keys if not k.endswith('.attn.bias')]  # discard mask
+        sd_keys = list(sd.keys())
 
         # init a HF model
         model_hf = GPT2LMHeadModel.from_pretrained(model_type)
@@ -203,15 +214,31 @@ class GPT(nn.Module):
         print(f"num decayed parameter tensors: {len(decay_params)}, with {num_decay_params:,} parameters")
         print(f"num non-decayed parameter tensors: {len(nodecay_params)}, with {num_nodecay_paramas:,} parameters")
         
-        # create AdamW optimizer, use the fused version if available 
-        fused_available = "fused" in inspect.signature(torch.optim.AdamW).parameters
-        use_fused = fused_available and device_type == 'cuda'
-        print(f"using fused AdamW: {use_fused}")
-        optimizer = torch.optim.AdamW(optim_groups, lr=learning_rate, betas=(0.9, 0.95), eps=1e-8, fused=use_fused)
+        # prefer the bitsandbytes 8-bit AdamW when available: blockwise-quantized moments
+        # are ~4x smaller, quartering the HBM traffic of the bandwidth-bound optimizer step
+        try:
+            import bitsandbytes as bnb
+            bnb_available = True
+        except ImportError:
+            bnb_available = False
+        use_8bit = bnb_available and device_type == 'cuda'
+        if use_8bit:
+            print("using bitsandbytes AdamW8bit")
+            optimizer = bnb.optim.AdamW8bit(optim_groups, lr=learning_rate, betas=(0.9, 0.95), eps=1e-8)
+        else:
+            # otherwise create AdamW optimizer, use the fused version if available;
+            # capturable keeps the step replayable inside a reduce-overhead CUDA graph
+            fused_available = "fused" in inspect.signature(torch.optim.AdamW).parameters
+            use_fused = fused_available and device_type == 'cuda'
+            print(f"using fused AdamW: {use_fused}")
+            optimizer = torch.optim.AdamW(optim_groups, lr=learning_rate, betas=(0.9, 0.95), eps=1e-8,
+                                          fused=use_fused, capturable=use_fused)
         return optimizer
 
 
 # -------------------------------------------------------------------
+import queue
+import threading
 import tiktoken
 import numpy as np
 
@@ -246,12 +273,10 @@ import numpy as np
 #         return x, y
 
 def load_tokens(filename):
-    npt = np.load(filename)
-    # Earlier version of PyTorch may have difficulty converting from uint16 to long
-    # use numpy to convert uint16 to int32 before converting to torch tensor and then converting to long.
-    npt = npt.astype(np.int32)
-    ptt = torch.tensor(npt, dtype=torch.long)
-    return ptt
+    # memory-map the shard instead of reading it: np.load + astype used to allocate and
+    # copy hundreds of MB on every shard rollover, stalling the training loop; the uint16
+    # tokens now stay on disk and next_batch converts only the slice it consumes
+    return np.load(filename, mmap_mode='r')
 
 
 class DataLoaderLite:
@@ -272,17 +297,37 @@ class DataLoaderLite:
         assert len(shards) > 0, f"no shards found for split {split}"
         if master_process:
             print(f"found {len(shards)} shards for split {split}")
+        self._prefetch_thread = None
         self.reset()
-        
+
     def reset(self):
-        # state, init at shard zero 
-        self.current_shard = 0 
+        # stop the current prefetch worker (if any) before rewinding state
+        if self._prefetch_thread is not None:
+            self._stop_event.set()
+            # drain so a worker blocked on a full queue can finish and exit
+            while not self._queue.empty():
+                self._queue.get()
+            self._prefetch_thread.join()
+        # state, init at shard zero
+        self.current_shard = 0
         self.tokens = load_tokens(self.shards[self.current_shard])
         self.current_position = self.B * self.T * self.process_rank
-        
-    def next_batch(self):
-        B, T, = self.B, self.T 
+        # background worker, so batch assembly (slice/astype/pinning) and shard rollover
+        # run off the training thread and overlap with GPU compute
+        self._queue = queue.Queue(maxsize=4)
+        self._stop_event = threading.Event()
+        self._prefetch_thread = threading.Thread(target=self._prefetch, daemon=True)
+        self._prefetch_thread.start()
+
+    def _load_next_batch(self):
+        B, T, = self.B, self.T
         buf = self.tokens[self.current_position : self.current_position+B*T+1]
+        # Earlier version of PyTorch may have difficulty converting from uint16 to long,
+        # go through numpy; only the B*T+1 slice pays the astype, not the whole shard
+        buf = torch.from_numpy(buf.astype(np.int64))
+        # pin so the H2D copy in the training loop can run asynchronously
+        if torch.cuda.is_available():
+            buf = buf.pin_memory()
         x = buf[:-1].view(B, T)
         y = buf[1:].view(B, T)
         self.current_position += B * T * self.num_processes
@@ -294,34 +339,85 @@ class DataLoaderLite:
             self.current_position = self.B * self.T * self.process_rank
         return x, y
 
+    def _prefetch(self):
+        while not self._stop_event.is_set():
+            try:
+                batch = self._load_next_batch()
+            except Exception as e:
+                # hand the exception to the training thread, a silently dead worker
+                # would leave next_batch() blocked forever
+                batch = e
+            while not self._stop_event.is_set():
+                try:
+                    self._queue.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if isinstance(batch, Exception):
+                return
+
+    def next_batch(self):
+        batch = self._queue.get()
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
 
 # -------------------------------------------------------------------
 
 def get_most_likely_row(tokens, mask, logits):
     # takes tokens, mask, and logits, returns the index of the completion with the lowest loss
 
-    # evaluate the autoregressive loss at all positions
+    # evaluate the autoregressive loss only at completion positions (mask == 1); losses at
+    # prompt/padding positions would be masked out anyway, so skip their softmax entirely
     shift_logits = (logits[..., :-1, :]).contiguous()
     shift_tokens = (tokens[..., 1:]).contiguous()
+    shift_mask = (mask[..., 1:]).contiguous() # we must shift mask, so we start at the last prompt token
     flat_shift_logits = shift_logits.view(-1, shift_logits.size(-1))
     flat_shift_tokens = shift_tokens.view(-1)
-    shift_losses = F.cross_entropy(flat_shift_logits, flat_shift_tokens, reduction='none')
-    shift_losses = shift_losses.view(tokens.size(0), -1)
 
-    # now get the average loss just for the completion region (where mask == 1), in each row
-    shift_mask = (mask[..., 1:]).contiguous() # we must shift mask, so we start at the last prompt token
-    masked_shift_losses = shift_losses * shift_mask
+    # positions where the loss counts, and the candidate row each one belongs to
+    active = shift_mask.view(-1).nonzero().squeeze(-1)
+    active_rows = active // shift_tokens.size(1)
+    active_losses = F.cross_entropy(flat_shift_logits[active], flat_shift_tokens[active], reduction='none')
 
-    # sum and divide by the number of 1s in the mask
-    sum_loss = masked_shift_losses.sum(dim=1)
+    # sum per candidate row and divide by the number of 1s in the mask
+    sum_loss = torch.zeros(tokens.size(0), dtype=active_losses.dtype, device=active_losses.device)
+    sum_loss.scatter_add_(0, active_rows, active_losses)
     avg_loss = sum_loss / shift_mask.sum(dim=1)
-    
+
     # now we have a loss for each of the 4 completions
     # the one with the lowest loss should be the most likely
     pred_norm = avg_loss.argmin().item()
     return pred_norm
 
 
+def evaluate_hellaswag_chunk(model, examples, device):
+    # runs a chunk of HellaSwag examples through a single forward instead of one forward
+    # per example; each example contributes its 4 candidate rows, padded to the chunk-wide
+    # max length (padding carries mask 0, so it never enters the loss),
+    # returns the number of correctly predicted examples
+    max_len = max(tokens.size(1) for tokens, _, _ in examples)
+    batch_tokens = torch.zeros((4 * len(examples), max_len), dtype=torch.long)
+    batch_mask = torch.zeros((4 * len(examples), max_len), dtype=torch.long)
+    for j, (tokens, mask, _) in enumerate(examples):
+        batch_tokens[4*j : 4*j+4, :tokens.size(1)] = tokens
+        batch_mask[4*j : 4*j+4, :mask.size(1)] = mask
+    if torch.cuda.is_available():
+        batch_tokens, batch_mask = batch_tokens.pin_memory(), batch_mask.pin_memory()
+    batch_tokens = batch_tokens.to(device, non_blocking=True)
+    batch_mask = batch_mask.to(device, non_blocking=True)
+    with torch.no_grad():
+        # NOTE: use BFLOAT 16
+        with torch.autocast(device_type=device_type, dtype=torch.bfloat16):
+            logits, loss = model(batch_tokens)
+    num_correct_norm = 0
+    for j, (_, _, label) in enumerate(examples):
+        pred_norm = get_most_likely_row(batch_tokens[4*j : 4*j+4], batch_mask[4*j : 4*j+4], logits[4*j : 4*j+4])
+        num_correct_norm += int(pred_norm == label)
+    return num_correct_norm
+
+
 # -------------------------------------------------------------------
 # simple launch:
 # python train_gpt2.py
@@ -329,7 +425,8 @@ def get_most_likely_row(tokens, mask, logits):
 # torchrun --standalone --nproc_per_node=8 train_gpt2.py
 
 import os
-import time 
+import time
+from contextlib import nullcontext
 from torch.distributed import init_process_group, destroy_process_group
 from torch.nn.parallel import DistributedDataParallel as DDP
 import torch.distributed as dist
@@ -369,9 +466,12 @@ if torch.cuda.is_available():
     
 enc = tiktoken.get_encoding('gpt2')
     
-total_batch_size = 524288 # 2**9, ~0.5M, in number of tokens 
-B = 1 # micro batch size
-T = 1024 # sequence length 
+total_batch_size = 524288 # 2**19, ~0.5M, in number of tokens
+# micro batch size; bf16 autocast frees enough activation memory that 16 sequences fit
+# comfortably for the 124M model, and every 16x on B cuts grad_accum_steps (and with it
+# Python-loop, launch, and all-reduce overhead) by the same factor
+B = 16
+T = 1024 # sequence length
 assert total_batch_size % (B * T * ddp_world_size) == 0, "make sure total_batch_size is divisible by B * T * ddp_world_size"
 grad_accum_steps = total_batch_size // (B * T * ddp_world_size)
 if master_process:
@@ -381,20 +481,26 @@ if master_process:
 train_loader = DataLoaderLite(B=B, T=T, process_rank=ddp_rank, num_processes=ddp_world_size, split="train")
 val_loader = DataLoaderLite(B=B, T=T, process_rank=ddp_rank, num_processes=ddp_world_size, split="val")
 
-# # NOTE: use Tensor Float 32
-# torch.set_float32_matmul_precision("high")
+# NOTE: use Tensor Float 32 for any matmuls that stay in FP32
+torch.set_float32_matmul_precision("high")
 
 # model = GPT.from_pretrained('gpt2')
 # model.eval()
 # NOTE: expand vocab size to be powers of 2 for faster compute
 model = GPT(GPTConfig(vocab_size=50304))
 model.to(device)
-use_compile = False # enabling torch.compile interferes with HellaSwag eval and Generation
+raw_model = model # always contains the unwrapped, uncompiled model
+# NOTE: the training loop runs with fixed (B, T) shapes, so torch.compile can fuse the
+# pointwise chains (LayerNorm + residual + GELU) and cut per-op dispatch overhead;
+# HellaSwag eval and generation have varying sequence lengths and would trigger
+# recompilation, so those paths go through raw_model instead
+use_compile = True
 if use_compile:
-    model = torch.compile(model)
+    # reduce-overhead records the step as a CUDA graph and replays it, cutting kernel
+    # launch overhead, which dominates at tiny micro-batches
+    model = torch.compile(model, mode="reduce-overhead")
 if ddp:
     model = DDP(model, device_ids=[ddp_local_rank])
-raw_model = model.module if ddp else model # always contains the unwrapper model
 
 max_lr = 6e-4
 min_lr = max_lr * 0.1
@@ -424,8 +530,22 @@ optimizer = raw_model.configure_optimizers(weight_decay=0.1, learning_rate=6e-4,
 log_dir = "log"
 os.makedirs(log_dir, exist_ok=True)
 log_file = os.path.join(log_dir, f"log.txt")
-with open(log_file, "w") as f: # open for writing to clear the file 
-    pass 
+with open(log_file, "w") as f: # open for writing to clear the file
+    pass
+
+# static device-side input buffers: the microbatch loop always feeds the same (B, T)
+# shapes, so copying into persistent tensors keeps the input addresses stable across
+# steps for the CUDA graphs recorded by reduce-overhead mode
+if device_type == "cuda":
+    x_buf = torch.empty((B, T), dtype=torch.long, device=device)
+    y_buf = torch.empty((B, T), dtype=torch.long, device=device)
+
+# rendered HellaSwag examples for this rank, filled lazily on the first eval
+hella_examples = None
+
+# collect the parameter list for grad clipping once, instead of re-traversing the module
+# tree via model.parameters() every step
+clip_params = [p for p in model.parameters() if p.requires_grad]
 
 for step in range(max_steps):
     t0 = time.time()
@@ -440,11 +560,10 @@ for step in range(max_steps):
             val_loss_steps = 20
             for _ in range(val_loss_steps):
                 x, y = val_loader.next_batch()
-                x, y = x.to(device), y.to(device)
-                logits, loss = model(x, y)
-                # # NOTE: use BFLOAT 16
-                # with torch.autocast(device_type=device_type, dtype=torch.bfloat16):
-                #     logits, loss = model(x, y)
+                x, y = x.to(device, non_blocking=True), y.to(device, non_blocking=True)
+                # NOTE: use BFLOAT 16
+                with torch.autocast(device_type=device_type, dtype=torch.bfloat16):
+                    logits, loss = model(x, y)
                 loss = loss / val_loss_steps
                 val_loss_accum += loss.detach() # for bookkeeping
         if ddp:
@@ -465,27 +584,24 @@ for step in range(max_steps):
                 # optionally also add optimizer state dict and rng seeds, etc.. 
                 torch.save(checkpoint, checkpoint_path)
 
-    # once in a while evaluate hellaswag 
-    if (step % 250 == 0 or last_step) and (not use_compile):
+    # once in a while evaluate hellaswag
+    if step % 250 == 0 or last_step:
+        # render this rank's examples once and reuse them on every eval; re-encoding the
+        # same 10k examples every 250 steps is pure duplicated CPU tokenizer work
+        if hella_examples is None:
+            hella_examples = []
+            for i, example in enumerate(iterate_examples("val")):
+                # only process sample where i % world_size == ddp_rank, to make use of DDP
+                if i % ddp_world_size != ddp_rank:
+                    continue
+                # render the example into tokens and lables
+                _, tokens, mask, label = render_example(example)
+                hella_examples.append((tokens, mask, label))
         num_correct_norm = 0
-        num_total = 0
-        for i, example in enumerate(iterate_examples("val")):
-            # only process sample where i % world_size == ddp_rank, to make use of DDP
-            if i % ddp_world_size != ddp_rank:
-                continue
-            # render the example into tokens and lables 
-            _, tokens, mask, label = render_example(example)
-            tokens = tokens.to(device)
-            mask = mask.to(device)
-            # get logits
-            with torch.no_grad():
-                logits, loss = model(tokens)
-                # # NOTE: use BFLOAT 16
-                # with torch.autocast(device_type=device_type, dtype=torch.bfloat16):
-                #     logits, loss = model(tokens)
-                pred_norm = get_most_likely_row(tokens, mask, logits)
-            num_total += 1
-            num_correct_norm += int(pred_norm == label)
+        num_total = len(hella_examples)
+        hella_chunk = 8 # examples per forward (32 rows), amortizes launch overhead
+        for start in range(0, len(hella_examples), hella_chunk):
+            num_correct_norm += evaluate_hellaswag_chunk(raw_model, hella_examples[start : start+hella_chunk], device)
         # reduce stats across all processes
         if ddp:
             num_total = torch.tensor(num_total, dtype=torch.long, device=device)
@@ -501,27 +617,35 @@ for step in range(max_steps):
                 f.write(f"{step} hella {acc_norm:.4f}\n")
             
     # once in a while generate from the model (except at step 0)
-    # might need to disable torch.compile
-    if ((step > 0 and step % 250 == 0) or last_step) and (not use_compile):
+    # master only: the samples are purely for inspection and no collective is involved,
+    # so running the loop on every rank is wasted compute under DDP
+    if ((step > 0 and step % 250 == 0) or last_step) and master_process:
         model.eval()
         num_return_sequences = 4
         max_length = 32
 
-        # prefix tokens 
+        # prefix tokens
         tokens = enc.encode("Hello, I'm a language model,")
-        tokens = torch.tensor(tokens, dtype=torch.long) # (8,)
-        tokens = tokens.unsqueeze(0).repeat(num_return_sequences, 1)    # (4, 8)
-        xgen = tokens.to(device)
+        prompt_len = len(tokens)
+        # preallocate the output buffer and fill it in place; torch.cat per step would
+        # reallocate and copy the whole sequence for every sampled token
+        xgen = torch.zeros((num_return_sequences, max_length), dtype=torch.long, device=device)
+        xgen[:, :prompt_len] = torch.tensor(tokens, dtype=torch.long)
+        cur_len = prompt_len
 
         # NOTE: use a separate random number generator here to keep reproducibility,
         # while not interfering with the global random number generator
         sample_rng = torch.Generator(device=device)
         sample_rng.manual_seed(42 + ddp_rank)
 
-        while xgen.size(1) < max_length:
+        while cur_len < max_length:
             with torch.no_grad():
-                logits, loss = model(xgen)   # (B, T, vocab_size)
-                logits = logits[:, -1, :]   # (B, vocab_size)
+                # NOTE: use BFLOAT 16
+                with torch.autocast(device_type=device_type, dtype=torch.bfloat16):
+                    logits, loss = raw_model(xgen[:, :cur_len])   # (B, T, vocab_size)
+                # drop the padded vocab columns: they see no gradient from the sliced
+                # cross-entropy, so their logits are garbage and must not be sampled
+                logits = logits[:, -1, :50257]   # (B, vocab_size)
                 probs = F.softmax(logits, dim=-1)
 
                 # top-k sampling 
@@ -530,9 +654,10 @@ for step in range(max_steps):
                 # select a token 
                 ix = torch.multinomial(topk_probs, 1, generator=sample_rng)   # (B, 1)
                 xcol = torch.gather(topk_indices, -1, ix)   # (B, 1)
-                # append 
-                xgen = torch.cat((xgen, xcol), dim=1)
-                
+                # write the sampled token into the preallocated buffer
+                xgen[:, cur_len] = xcol.view(-1)
+                cur_len += 1
+
         # print generated text 
         for i in range(num_return_sequences):
             tokens = xgen[i, :max_length].tolist()
@@ -541,35 +666,43 @@ for step in range(max_steps):
             
     # training loop 
     model.train()
-    optimizer.zero_grad()
-    loss_accum = 0.0
+    # free grads instead of writing zeros into them, the zero-fill is pure HBM traffic
+    optimizer.zero_grad(set_to_none=True)
+    # accumulate microbatch losses into a device-side scalar, the GPU-CPU sync is paid
+    # once per step when .item() is called at logging time
+    loss_accum = torch.zeros((), device=device)
 
     # NOTE: use gradient accumulation to achieve any batch size given current hardware limitation
     # but need to divide each micro-batch loss by grad_accum_steps for correct loss mean/reduction
     for micro_step in range(grad_accum_steps):
         x, y = train_loader.next_batch()
-        x, y = x.to(device), y.to(device)
-
-        # each call to loss backward will trigger DDP to synchronize gradients across GPUs, 
-        # instead of using no_sync() context manager, Karpaphy toggles the require_backward_grad_sync flag
-        # to only trigger the sync at the last microstep 
-        # also, this field is also used by the forward pass, hence put it earlier here
-        if ddp:
-            model.require_backward_grad_sync = (micro_step == grad_accum_steps - 1)
-
-        logits, loss = model(x, y)
-        # # NOTE: use BFLOAT 16
-        # with torch.autocast(device_type=device_type, dtype=torch.bfloat16):
-        #     logits, loss = model(x, y)
-        loss = loss / grad_accum_steps
-        loss_accum += loss.detach() # for bookkeeping
-        loss.backward()
+        # async H2D copies, overlap with GPU work still in flight (shards are pinned);
+        # on CUDA, copy into the static buffers so the graphed step sees fixed addresses
+        if device_type == "cuda":
+            x_buf.copy_(x, non_blocking=True)
+            y_buf.copy_(y, non_blocking=True)
+            x, y = x_buf, y_buf
+        else:
+            x, y = x.to(device), y.to(device)
+
+        # each call to loss backward will trigger DDP to synchronize gradients across GPUs,
+        # wrap all but the last microstep in no_sync() so the gradient all-reduce only
+        # fires once per optimizer step instead of once per microbatch
+        sync_context = model.no_sync() if ddp and micro_step < grad_accum_steps - 1 else nullcontext()
+        with sync_context:
+            # NOTE: use BFLOAT 16, keep the loss scaling and backward outside the autocast region
+            with torch.autocast(device_type=device_type, dtype=torch.bfloat16):
+                logits, loss = model(x, y)
+            loss = loss / grad_accum_steps
+            loss_accum += loss.detach() # for bookkeeping
+            loss.backward()
         
     if ddp:
         dist.all_reduce(loss_accum, op=dist.ReduceOp.AVG)
     
-    # NOTE: use gradient norm clipping as regularization        
-    norm = torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+    # NOTE: use gradient norm clipping as regularization
+    # foreach batches the norm + scale across all grads into a few fused kernels
+    norm = torch.nn.utils.clip_grad_norm_(clip_params, 1.0, foreach=True)
 
     # learning rate scheduling 
     lr = get_lr(step)